@@ -1,13 +1,60 @@
 import utils
+import array
+import ijson
 import json
+import numpy
+import orjson
+import os
+import stat
+import time
 import typer
 import tempfile
 import contextlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional
 
 app = typer.Typer(no_args_is_help=True)
 
+# "Constant" (i.e., fixed for duration of execution)
+TEMPLATES_DIR = utils.repo_root() / "circuit/templates"
+
+# Constraints files below this size are parsed in one shot with orjson (much
+# faster C parse); larger ones go through the O(1)-memory ijson event stream.
+SMALL_CONSTRAINTS_FILE_SIZE = 100 * 1024 * 1024
+
+
+def _iter_constraint_indices(path):
+    """
+    Yield one (a, b, c) triple of wire-index lists per R1CS constraint in
+    `path`, without keeping more than one constraint alive at a time on the
+    large-file path.
+    """
+    st = os.stat(path)
+    if stat.S_ISREG(st.st_mode) and st.st_size < SMALL_CONSTRAINTS_FILE_SIZE:
+        constraints = orjson.loads(Path(path).read_bytes())["constraints"]
+        for a, b, c in constraints:
+            yield list(map(int, a)), list(map(int, b)), list(map(int, c))
+    else:
+        # Walk the raw ijson event stream instead of letting ijson build the
+        # {wire index: coeff} dict each row implies: we only need the wire
+        # indices, and a Python dict costs tens of bytes of overhead per
+        # entry. Each row's indices live in a throwaway array.array('i').
+        with open(path, "rb") as f:
+            row = []
+            indices = array.array('i')
+            for prefix, event, value in ijson.parse(f, use_float=False):
+                if prefix != "constraints.item.item":
+                    continue
+                if event == "map_key":
+                    indices.append(int(value))
+                elif event == "end_map":
+                    row.append(indices)
+                    indices = array.array('i')
+                    if len(row) == 3:
+                        yield tuple(row)
+                        row = []
+
 @app.command()
 def install_deps():
     """Install the dependencies required for compiling the circuit and building witness-generation binaries."""
@@ -24,22 +71,25 @@ def compile(
     o: bool = typer.Option(
         False, "--optimized", "-o", help="Enables optimization passes (--O2) for compiling the circuit to a smaller R1CS"
     ),
+    emit_json: bool = typer.Option(
+        True, help="Also emit the constraints as JSON (main_constraints.json). Serializing it can dominate compile time for large circuits."
+    ),
 ):
     """Compiles the circuit to R1CS, creating a main.r1cs, main_constraints.json, and main.sym file next to main.circom. Useful for testing."""
-    templates_dir = utils.repo_root() / "circuit/templates"
-
     if circom_file_path is None:
-        circom_file_path = templates_dir / "main.circom"
+        circom_file_path = TEMPLATES_DIR / "main.circom"
         typer.echo(f"No circom file path provided. Defaulting to main.circom.")
 
     oFlag = "--O0"
     if o == True:
         oFlag = "--O2"
 
+    jsonFlag = "--json" if emit_json else ""
+
     typer.echo(f"Compiling {circom_file_path}...")
     typer.echo()
 
-    circom_cmd = f"circom {oFlag} -l {templates_dir} -l $(. ~/.nvm/nvm.sh; npm root -g) {circom_file_path} --r1cs --json --sym"
+    circom_cmd = f"circom {oFlag} -l {TEMPLATES_DIR} -l $(. ~/.nvm/nvm.sh; npm root -g) {circom_file_path} --r1cs {jsonFlag} --sym"
 
     typer.echo("Compiling via:")
     typer.echo(f" {circom_cmd}")
@@ -47,47 +97,173 @@ def compile(
     utils.run_shell_command(f"time {circom_cmd}")
 
 
+def _union3_count(a, b, c):
+    """
+    Count the distinct values across three sorted integer lists with a
+    three-way linear sweep. Unlike `len(a | b | c)` on dicts, this never
+    hashes a key or allocates a merged container.
+    """
+    count = 0
+    ia = ib = ic = 0
+    len_a, len_b, len_c = len(a), len(b), len(c)
+    inf = float("inf")
+
+    while ia < len_a or ib < len_b or ic < len_c:
+        x = a[ia] if ia < len_a else inf
+        y = b[ib] if ib < len_b else inf
+        z = c[ic] if ic < len_c else inf
+        smallest = min(x, y, z)
+        count += 1
+        if x == smallest:
+            ia += 1
+        if y == smallest:
+            ib += 1
+        if z == smallest:
+            ic += 1
+
+    return count
+
+
 @app.command()
 def count_r1cs_nonzero_terms(
     constraints_json_path: Optional[Path] = typer.Option(
-        None, "--json", "-j", help="Optional path to main_constraints.json")
+        None, "--json", "-j", help="Optional path to main_constraints.json"),
+    with_union: bool = typer.Option(
+        False, "--with-union", help="Also count nonzero terms of r_1 A + r_2 B + r_3 C. Much slower, since it requires a per-row set union. Implies --full."),
+    full: bool = typer.Option(
+        False, "--full", help="Compute the per-matrix nonzero counts from the constraints JSON. Without this (and without --json), only the quick `snarkjs r1cs info` summary is printed.")
 ):
     """
     Counts the number of nonzero constraints in each of the R1CS matrices.
 
     If `constraints_path` is given, loads constraints from that file.
-    Otherwise, compiles the circuit in a temporary directory.
+    Otherwise, compiles the circuit in a temporary directory; by default this
+    skips the constraints JSON entirely and prints the cheap summary that
+    `snarkjs r1cs info` extracts from the binary R1CS.
     """
-    def load_and_count(path: str):
-        a_nonzero = b_nonzero = c_nonzero = 0
+    full = full or with_union
+    # Parsing a multi-hundred-MB constraints file takes a while, so the
+    # computed stats are cached on disk keyed by a checksum. On a hit we
+    # skip the parse (and possibly the compilation) entirely.
+    def stats_cache_path(cache_key: str):
+        return utils.resources_dir_root() / "r1cs_stats" / (cache_key + ".json")
+
+    def cached_stats(cache_key: str):
+        cache_path = stats_cache_path(cache_key)
+        if cache_path.is_file():
+            stats = json.loads(cache_path.read_text())
+            if not with_union or "union_nonzero" in stats:
+                return stats
+        return None
+
+    def load_and_count(path: str, cache_key: str):
+        stats = cached_stats(cache_key)
+        if stats is None:
+            stats = compute_stats(path)
+            cache_path = stats_cache_path(cache_key)
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            cache_path.write_text(json.dumps(stats))
+        print_stats(stats)
+
+    def compute_stats(path: str):
         union_nonzero = 0
-        max_nonzero = 0
 
-        with open(path) as f:
-            constraints = json.load(f)["constraints"]
-            for [a, b, c] in constraints:
-                a_nonzero += len(a)
-                b_nonzero += len(b)
-                c_nonzero += len(c)
-                union_nonzero += len(a | b | c)
-                max_nonzero += max(len(a), len(b), len(c))
+        # Per-row nonzero counts, accumulated into flat int buffers so that
+        # the sums and the row-wise max below can be done by numpy in C
+        # rather than one dict operation at a time in the interpreter.
+        la = array.array('i')
+        lb = array.array('i')
+        lc = array.array('i')
 
-        total_nonzero = a_nonzero + b_nonzero + c_nonzero
+        for a, b, c in _iter_constraint_indices(path):
+            la.append(len(a))
+            lb.append(len(b))
+            lc.append(len(c))
+            if with_union:
+                # We only need the cardinality of the union, so merge-count
+                # the sorted wire-index lists.
+                union_nonzero += _union3_count(sorted(a), sorted(b), sorted(c))
+
+        a_counts = numpy.frombuffer(la, dtype=numpy.int32)
+        b_counts = numpy.frombuffer(lb, dtype=numpy.int32)
+        c_counts = numpy.frombuffer(lc, dtype=numpy.int32)
+
+        a_nonzero = int(a_counts.sum())
+        b_nonzero = int(b_counts.sum())
+        c_nonzero = int(c_counts.sum())
+        # One fused element-wise max over the three buffers, then a single
+        # sum; avoids materializing an intermediate max(a, b) array.
+        max_nonzero = int(numpy.maximum.reduce([a_counts, b_counts, c_counts]).sum())
+
+        stats = {
+            "a_nonzero": a_nonzero,
+            "b_nonzero": b_nonzero,
+            "c_nonzero": c_nonzero,
+            "max_nonzero": max_nonzero,
+        }
+        if with_union:
+            stats["union_nonzero"] = union_nonzero
+        return stats
+
+    def print_stats(stats):
+        total_nonzero = stats["a_nonzero"] + stats["b_nonzero"] + stats["c_nonzero"]
 
         print("")
-        print(f"The matrix A has {a_nonzero:,} nonzero terms.")
-        print(f"The matrix B has {b_nonzero:,} nonzero terms.")
-        print(f"The matrix C has {c_nonzero:,} nonzero terms.")
+        print(f"The matrix A has {stats['a_nonzero']:,} nonzero terms.")
+        print(f"The matrix B has {stats['b_nonzero']:,} nonzero terms.")
+        print(f"The matrix C has {stats['c_nonzero']:,} nonzero terms.")
         print("-------------------------------------------------")
         print(f"nonzero(A) + nonzero(B) + nonzero(C): {total_nonzero:,} .")
-        print(f"nonzero(r_1 A + r_2 B + r_3 C): {union_nonzero:,} .")
-        print(f"Row-wise max of nonzero terms count: {max_nonzero:,} .")
+        if with_union:
+            print(f"nonzero(r_1 A + r_2 B + r_3 C): {stats['union_nonzero']:,} .")
+        print(f"Row-wise max of nonzero terms count: {stats['max_nonzero']:,} .")
 
     if constraints_json_path:
-        load_and_count(constraints_json_path)
-    else:
+        load_and_count(constraints_json_path, utils.file_fingerprint(constraints_json_path))
+    elif not full:
+        # Lightweight default: don't have circom serialize the constraints
+        # JSON at all; snarkjs reads the binary R1CS and prints its summary
+        # in a fraction of a second.
         with tempfile.TemporaryDirectory() as temp_dir:
             with contextlib.chdir(temp_dir):
-                compile(o=True, circom_file_path=None)
-                load_and_count("main_constraints.json")
+                compile(o=True, circom_file_path=None, emit_json=False)
+                utils.run_shell_command(". ~/.nvm/nvm.sh; snarkjs r1cs info main.r1cs")
+    else:
+        # Key on the circom sources rather than the compiled JSON, so a cache
+        # hit also skips the recompilation of an unchanged circuit.
+        cache_key = utils.directory_checksum(TEMPLATES_DIR, ".circom")
+        if cached_stats(cache_key) is not None:
+            load_and_count(None, cache_key)
+        else:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                with contextlib.chdir(temp_dir):
+                    # Pre-create the constraints output as a FIFO, so the
+                    # parser consumes circom's JSON as it is written instead
+                    # of letting hundreds of MB hit the disk only to be read
+                    # straight back.
+                    os.mkfifo("main_constraints.json")
+                    with ThreadPoolExecutor(max_workers=1) as executor:
+                        reader = executor.submit(load_and_count,
+                                                 "main_constraints.json", cache_key)
+                        try:
+                            compile(o=True, circom_file_path=None)
+                        finally:
+                            # If circom exited without ever opening the FIFO,
+                            # briefly connect a writer so the blocked reader
+                            # sees EOF instead of hanging. Retried because the
+                            # reader may not have reached its open() yet; the
+                            # extra non-blocking read end is needed since a
+                            # reader still blocked in open() doesn't count as
+                            # having the FIFO open for reading.
+                            while not reader.done():
+                                try:
+                                    rfd = os.open("main_constraints.json",
+                                                  os.O_RDONLY | os.O_NONBLOCK)
+                                    os.close(os.open("main_constraints.json",
+                                                     os.O_WRONLY | os.O_NONBLOCK))
+                                    os.close(rfd)
+                                except OSError:
+                                    pass
+                                time.sleep(0.05)
+                        reader.result()
 
@@ -23,8 +23,8 @@ def install_circom_precommit_hook():
 
     eprint("Installing precommit hook...")
 
-    hook_src_path = utils.repo_root() + "/git-hooks/compile-circom-if-needed-pre-commit"
-    hook_dest_path = utils.repo_root() + "/.git/hooks/pre-commit"
+    hook_src_path = utils.repo_root() / "git-hooks/compile-circom-if-needed-pre-commit"
+    hook_dest_path = utils.repo_root() / ".git/hooks/pre-commit"
     eprint(hook_src_path)
     eprint(hook_dest_path)
 
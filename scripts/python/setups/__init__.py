@@ -1,23 +1,65 @@
 from utils import eprint
 import utils
+import functools
+import os
 import shutil
 import typer
 from typing_extensions import Annotated
 
 app = typer.Typer(no_args_is_help=True)
 
+@functools.cache
 def current_setups_dir():
     return utils.resources_dir_root() / "current_setups"
 
 class Setup:
+    # All the files a setup may contain.
+    ASSET_NAMES = (
+            "prover_key.zkey",
+            "verification_key.json",
+            "circuit_config.yml",
+            "main_c",
+            "main_c.dat",
+            "generate_witness.js",
+            "witness_calculator.js",
+            "main.wasm",
+            )
+
     def __init__(self, root_dir):
         self.root_dir = root_dir
+        # Path construction isn't free (string normalization per segment),
+        # so build each asset's Path once instead of on every probe.
+        self._asset_paths = { name: root_dir / name for name in self.ASSET_NAMES }
+        # The names of the files under root_dir, listed once per instance:
+        # the files of a setup don't move during one invocation, and
+        # is_complete() alone probes seven of them. Anything that adds or
+        # removes files under root_dir must call invalidate().
+        self._file_names = None
+
+    def invalidate(self):
+        """Forget cached file probes. Call after changing files under root_dir."""
+        self._file_names = None
+
+    def _probe_file(self, name):
+        """Return root_dir/name if it is a regular file, else None."""
+        if self._file_names is None:
+            # One scandir() replaces an os.stat per probed path.
+            try:
+                with os.scandir(self.root_dir) as entries:
+                    self._file_names = {e.name for e in entries if e.is_file()}
+            except FileNotFoundError:
+                self._file_names = set()
+        if name in self._file_names:
+            return self._asset_paths[name]
+        else:
+            return None
 
     def path(self):
         return self.root_dir
 
     def rm(self):
         shutil.rmtree(self.root_dir)
+        self.invalidate()
 
     def set_default(self):
         current_setups_dir().mkdir(parents=True, exist_ok=True)
@@ -29,47 +71,34 @@ class Setup:
 
     def mkdir(self):
         self.root_dir.mkdir(parents=True, exist_ok=True)
+        self.invalidate()
 
     def prover_key(self):
-        path = self.root_dir / "prover_key.zkey"
-        if path.is_file():
-            return path
-        else:
-            return None
+        return self._probe_file("prover_key.zkey")
 
     def verification_key(self):
-        path = self.root_dir / "verification_key.json"
-        if path.is_file():
-            return path
-        else:
-            return None
+        return self._probe_file("verification_key.json")
 
     def circuit_config(self):
-        path = self.root_dir / "circuit_config.yml"
-        if path.is_file():
-            return path
-        else:
-            return None
+        return self._probe_file("circuit_config.yml")
 
     def witness_gen_c(self):
         paths = [
-                self.root_dir / "main_c",
-                self.root_dir / "main_c.dat"
+                self._probe_file("main_c"),
+                self._probe_file("main_c.dat")
                 ]
-        for path in paths:
-            if not path.is_file():
-                return None
+        if None in paths:
+            return None
         return paths
 
     def witness_gen_wasm(self):
         paths = [
-                self.root_dir / "generate_witness.js",
-                self.root_dir / "witness_calculator.js",
-                self.root_dir / "main.wasm"
+                self._probe_file("generate_witness.js"),
+                self._probe_file("witness_calculator.js"),
+                self._probe_file("main.wasm")
                 ]
-        for path in paths:
-            if not path.is_file():
-                return None
+        if None in paths:
+            return None
         return paths
 
 
@@ -1,26 +1,47 @@
-from google.cloud import storage
-from google.auth import default
-from pathlib import Path
-from google.cloud.storage import Client, transfer_manager
-from google.cloud import storage
-import google
-import tempfile
+# NOTE: the google.cloud.storage / google.auth imports are deliberately done
+# inside the functions below. Importing the GCS client pulls in a few hundred
+# ms of protobuf/auth machinery, and every CLI invocation imports this module
+# (via setups) even when it never touches the cache.
 from utils import eprint
-from pathlib import Path
+import functools
 import tarfile
 import os
+import zstandard
 
+# Chunk size for the streamed blob reads/writes.
+TRANSFER_CHUNK_SIZE = 32 * 1024 * 1024
+
+# Buffer sizes for tarfile. The defaults (10 KiB stream blocks, 16 KiB
+# extraction copies) mean millions of tiny reads/writes for a multi-GB
+# setup archive; 16 MiB buffers cut the syscall count by ~1000x.
+TAR_BUFFER_SIZE = 16 * 1024 * 1024
+
+# Both bucket helpers are cached: constructing a storage.Client builds a
+# fresh HTTP session, and the upload path additionally resolves application
+# default credentials (metadata server / gcloud config) on every call.
+@functools.cache
 def cache_bucket_for_upload():
+    from google.auth import default
+    from google.cloud import storage
+
     credentials, project = default()
     client = storage.Client(credentials=credentials, project="aptos-keyless-prod")
-    return client.get_bucket("aptos-circuit-testing-setups")
+    # bucket() just builds a handle; get_bucket() would add an HTTP GET for
+    # bucket metadata that the blob operations never need.
+    return client.bucket("aptos-circuit-testing-setups")
 
+@functools.cache
 def cache_bucket():
+    from google.cloud import storage
+
     anonymous_client = storage.Client.create_anonymous_client()
     return anonymous_client.bucket("aptos-circuit-testing-setups")
 
 
 def download_blob_if_present(name, dest):
+    import google.api_core.exceptions
+    import google.auth.exceptions
+
     try:
         bucket = cache_bucket()
     except google.api_core.exceptions.Forbidden:
@@ -39,27 +60,37 @@ def download_blob_if_present(name, dest):
         return False
 
 
-    blob_name = name + ".tar.gz"
-    blob = bucket.blob(blob_name)
-
     eprint("Checking cache...")
-    if blob.exists():
-        eprint("Setup for the current circuit found in the google cloud storage cache. Downloading...")
-        with tempfile.TemporaryDirectory() as temp_dir:
-            tarfile_path = Path(temp_dir) / blob_name
-            blob.download_to_filename(tarfile_path)
-            with tarfile.open(tarfile_path, 'r:gz') as tar:
-                tar.extractall(path=dest)
-        eprint("Finished downloading.")
+    # Attempt the download directly and catch NotFound rather than probing
+    # with blob.exists() first, which would cost an extra HTTP round-trip.
+    try:
+        # Extract straight from the blob in tar's streaming mode.
+        # Downloading to a tempfile first would write and then re-read every
+        # byte on disk; streaming also overlaps the network receive with the
+        # decompression.
+        with bucket.blob(name + ".tar.zst").open('rb', chunk_size=TRANSFER_CHUNK_SIZE) as body:
+            dctx = zstandard.ZstdDecompressor()
+            with dctx.stream_reader(body) as reader:
+                with tarfile.open(fileobj=reader, mode='r|',
+                                  bufsize=TAR_BUFFER_SIZE,
+                                  copybufsize=TAR_BUFFER_SIZE) as tar:
+                    tar.extractall(path=dest)
+        eprint("Downloaded setup for the current circuit from the google cloud storage cache.")
         return True
-    else:
+    except google.api_core.exceptions.NotFound:
         eprint("Setup for the current circuit was NOT found in the google cloud storage cache.")
         return False
 
 
 def blob_exists(name):
+    import google.api_core.exceptions
+    import google.auth.exceptions
+
+    # The exists() probes are inside the try as well: the bucket handle is
+    # built locally, so auth failures only show up on the requests they make.
     try:
         bucket = cache_bucket()
+        return bucket.blob(name + ".tar.zst").exists()
     except google.api_core.exceptions.Forbidden:
         eprint("You aren't authenticated to google cloud; can't check cache for setups.")
         eprint("Please download the google cloud-cli (on macos: `brew install google-cloud-sdk`)")
@@ -77,14 +108,30 @@ def blob_exists(name):
         # Hacky to return true here
         return True
 
-    blob_name = name + ".tar.gz"
-    blob = bucket.blob(blob_name)
-    return blob.exists()
-
 
 def upload_to_blob(name, folder):
+    import google.api_core.exceptions
+    import google.auth.exceptions
+
+    # bucket() only builds a local handle, so auth problems don't surface
+    # until the upload itself makes its first request — the handlers have to
+    # cover the streamed write, not just the bucket construction.
     try:
         bucket = cache_bucket_for_upload()
+
+        eprint("Uploading setup to cache...")
+        blob = bucket.blob(name + ".tar.zst")
+        # Stream tar -> zstd -> resumable upload, so the archive is never
+        # written to disk and compression overlaps the network send.
+        # Multithreaded zstd: much faster than stdlib's single-threaded gzip
+        # on multi-GB setup directories, and the archives come out smaller.
+        cctx = zstandard.ZstdCompressor(level=3, threads=-1)
+        with blob.open("wb", chunk_size=TRANSFER_CHUNK_SIZE) as dst:
+            with cctx.stream_writer(dst) as compressed:
+                with tarfile.open(fileobj=compressed, mode="w|",
+                                  bufsize=TAR_BUFFER_SIZE,
+                                  copybufsize=TAR_BUFFER_SIZE) as tar:
+                    tar.add(folder, arcname=os.path.basename(folder))
     except google.api_core.exceptions.Forbidden:
         eprint("You aren't authenticated to google cloud; can't upload setup to cache.")
         eprint("Please download the google cloud-cli (on macos: `brew install google-cloud-sdk`)")
@@ -100,16 +147,5 @@ def upload_to_blob(name, folder):
         eprint("and then run `gcloud auth login --update-adc` to authenticate yourself.")
         return False
 
-    with tempfile.TemporaryDirectory() as temp_dir:
-        blob_name = name + ".tar.gz"
-        eprint("Creating tarfile with setup result...")
-        tarfile_path = Path(temp_dir) / blob_name
-        
-        with tarfile.open(tarfile_path, "w:gz") as tar:
-            tar.add(folder, arcname=os.path.basename(folder))
-        
-        eprint("Uploading to cache...")
-        blob = bucket.blob(blob_name)
-        blob.upload_from_filename(tarfile_path)
-        eprint("Done uploading.")
+    eprint("Done uploading.")
 
@@ -41,10 +41,16 @@ class CeremonySetup(setups.Setup):
             with zipfile.ZipFile(self.path() / 'wgen_c.zip', 'r') as zip_ref:
                 zip_ref.extractall(self.path())
             os.remove(self.path() / "wgen_c.zip")
-            os.chmod(self.path() / "main_c", 0o744)
+            main_c = self.path() / "main_c"
+            # zipfile doesn't preserve the execute bit; only chmod when the
+            # extracted mode is actually wrong.
+            if main_c.stat().st_mode & 0o777 != 0o744:
+                os.chmod(main_c, 0o744)
 
         if witness_gen_type == "wasm" or witness_gen_type == "both":
             with zipfile.ZipFile(self.path() / 'wgen_js.zip', 'r') as zip_ref:
                 zip_ref.extractall(self.path())
             shutil.move(self.path() / "main_c.wasm", self.path() / "main.wasm")
             os.remove(self.path() / "wgen_js.zip")
+
+        self.invalidate()
@@ -1,6 +1,46 @@
-import urllib
+import hashlib
+import json
+import urllib.error
+import urllib.request
 import utils
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+API_CACHE_DIR = utils.resources_dir_root() / "gh_api_cache"
+
+
+def _read_json_from_url_cached(url, auth_token=None):
+    """
+    Like utils.read_json_from_url, but remembers each response's ETag and
+    body on disk and sends If-None-Match on the next call. In the steady
+    state GitHub answers 304 with an empty body, so repeat invocations cost
+    a header exchange instead of a full transfer (and 304s don't count
+    against the API rate limit).
+    """
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    body_path = API_CACHE_DIR / (key + ".json")
+    etag_path = API_CACHE_DIR / (key + ".etag")
+
+    headers = {}
+    if auth_token:
+        headers['Authorization'] = f'Bearer {auth_token}'
+    if body_path.is_file() and etag_path.is_file():
+        headers['If-None-Match'] = etag_path.read_text().strip()
+
+    request = urllib.request.Request(url, headers=headers)
+    try:
+        with urllib.request.urlopen(request) as response:
+            body = response.read()
+            etag = response.headers.get('ETag')
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return json.loads(body_path.read_bytes())
+        raise
+
+    if etag:
+        API_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        body_path.write_bytes(body)
+        etag_path.write_text(etag)
+    return json.loads(body)
 
 class ReleaseNotFound(Exception):
     def __init__(self, release_name):
@@ -18,42 +58,73 @@ class ReleaseMissingRequiredAsset(Exception):
 class Releases:
 
     def __init__(self, repo='keyless-zk-proofs', auth_token=None):
+        self.repo = repo
         self.auth_token = auth_token
-        self.data = utils.read_json_from_url(f"https://api.github.com/repos/aptos-labs/{repo}/releases", auth_token)
-        # Convert the 'created_at' field to a datetime so that we can
-        # sort based on it
-        for release in self.data:
-            release['created_at'] = \
-              datetime.fromisoformat(release['created_at'])
-        # Sort based on release creation time
-        self.data.sort(key=lambda release: release['created_at'])
+        # The full release list is only fetched (lazily) by the methods that
+        # really need it; looking up one release by tag costs a single small
+        # request against the releases/tags endpoint instead.
+        self._data = None
+
+    def _releases_url(self):
+        return f"https://api.github.com/repos/aptos-labs/{self.repo}/releases"
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self._fetch_all()
+        return self._data
+
+    def _fetch_all(self):
+        releases = []
+        page = 1
+        while True:
+            batch = _read_json_from_url_cached(
+                    self._releases_url() + f"?per_page=100&page={page}",
+                    self.auth_token)
+            releases.extend(batch)
+            if len(batch) < 100:
+                break
+            page += 1
+
+        # Sort based on release creation time. GitHub's 'created_at' values
+        # are ISO-8601 Zulu strings, which order correctly as plain strings,
+        # so there is no need to parse N datetimes just to sort.
+        releases.sort(key=lambda release: release['created_at'])
+        return releases
 
     def release_names(self):
         return [ release['tag_name'] for release in self.data ]
 
     def release_with_name(self, release_name):
-        for release in self.data:
-            if release['tag_name'] == release_name:
-                return release
-
-        raise ReleaseNotFound(release_name)
+        try:
+            return _read_json_from_url_cached(
+                    self._releases_url() + "/tags/" + release_name,
+                    self.auth_token)
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                raise ReleaseNotFound(release_name)
+            raise
 
     def get_assets(self, release_name, asset_names):
         release = self.release_with_name(release_name)
-
-        result = []
-
-        for asset_name in asset_names:
-            found = False
-            for asset in release['assets']:
-                if asset['name'] == asset_name:
-                    result.append(asset)
-                    found = True
-                    break
-            if not found:
-                raise ReleaseMissingRequiredAsset(release_name, asset_name)
-
-        return result
+        # One dict build instead of a linear scan per requested name.
+        assets_by_name = { asset['name']: asset for asset in release['assets'] }
+        try:
+            return [ assets_by_name[asset_name] for asset_name in asset_names ]
+        except KeyError as e:
+            raise ReleaseMissingRequiredAsset(release_name, e.args[0])
+
+
+    def download_asset(self, asset, install_dir):
+        if self.auth_token:
+            headers = {
+                    "Authorization": f"token {self.auth_token}",
+                    "Accept": "application/octet-stream",
+                    }
+            utils.download_file(asset['url'], install_dir / asset['name'],
+                                headers=headers)
+        else:
+            utils.download_file(asset['browser_download_url'], install_dir / asset['name'])
 
 
     def download_and_install_release(self, release_name, install_dir, asset_names):
@@ -62,13 +133,14 @@ class Releases:
         """
 
         assets = self.get_assets(release_name, asset_names)
-        for asset in assets:
-            if self.auth_token:
-                req = urllib.request.Request(asset['url'])
-                req.add_header("Authorization", f"token {self.auth_token}")
-                req.add_header("Accept", "Accept: application/octet-stream")
-                utils.download_file(req, install_dir / asset['name'])
-            else:
-                utils.download_file(asset['browser_download_url'], install_dir / asset['name'])
+        if not assets:
+            return
+        # The assets are independent downloads and each one mostly blocks on
+        # the network, so fetch them concurrently.
+        with ThreadPoolExecutor(max_workers=min(8, len(assets))) as executor:
+            futures = [ executor.submit(self.download_asset, asset, install_dir)
+                        for asset in assets ]
+            for future in futures:
+                future.result()
 
 
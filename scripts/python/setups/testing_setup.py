@@ -1,5 +1,7 @@
 from setups import cache
 from datetime import datetime
+import functools
+import subprocess
 import time
 import shutil
 import utils
@@ -16,27 +18,95 @@ PTAU_PATH=utils.resources_dir_root() / "powersOfTau28_hez_final_21.ptau"
 PTAU_URL="https://storage.googleapis.com/zkevm/ptau/powersOfTau28_hez_final_21.ptau"
 PTAU_CHECKSUM="cdc7c94a6635bc91466d8c7d96faefe1d17ecc98a3596a748ca1e6c895f8c2b4"
 TESTING_SETUPS_DIR=utils.resources_dir_root() / "testing_setups"
+# Setups for other circuit checksums are kept this long after their last use,
+# so switching branches back doesn't force a multi-GB re-download or rebuild.
+STALE_SETUP_MAX_AGE_SECONDS = 14 * 24 * 60 * 60
+
+
+def prune_stale_setups(keep):
+    """
+    Delete setups under TESTING_SETUPS_DIR except those whose directory name
+    is in `keep` or which were used within the retention window. Previously
+    the whole directory was wiped before every rebuild, which deleted several
+    GB of perfectly good sibling setups every time a developer switched
+    branches.
+    """
+    TESTING_SETUPS_DIR.mkdir(parents=True, exist_ok=True)
+    now = time.time()
+    with os.scandir(TESTING_SETUPS_DIR) as entries:
+        for entry in entries:
+            if entry.name in keep:
+                continue
+            st = entry.stat(follow_symlinks=False)
+            # relatime mounts only update atime sporadically, so take
+            # whichever of atime/mtime is newer as "last used".
+            if now - max(st.st_atime, st.st_mtime) < STALE_SETUP_MAX_AGE_SECONDS:
+                continue
+            eprint("Deleting stale testing setup " + entry.name + "...")
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path)
+            else:
+                os.unlink(entry.path)
 
 
 
 
 
-def repo_circuit_checksum():
+def _build_dir():
+    """
+    A temporary build directory on the same filesystem as the setups dir, so
+    installing the multi-hundred-MB artifacts with shutil.move is a rename
+    rather than a copy+unlink (and the invoker's cwd isn't littered with
+    compilation output).
+    """
+    TESTING_SETUPS_DIR.mkdir(parents=True, exist_ok=True)
+    return tempfile.TemporaryDirectory(dir=TESTING_SETUPS_DIR)
+
+
+def _templates_fingerprint():
+    """
+    Cheap stat-only fingerprint of the circuit sources: file count, total
+    size and newest mtime. No file is opened.
+    """
+    count = 0
+    total_size = 0
+    newest_mtime_ns = 0
+    for child in (utils.repo_root() / "circuit/templates").rglob("*.circom"):
+        st = child.stat()
+        count += 1
+        total_size += st.st_size
+        newest_mtime_ns = max(newest_mtime_ns, st.st_mtime_ns)
+    return (count, total_size, newest_mtime_ns)
+
+
+@functools.cache
+def _repo_circuit_checksum_for(fingerprint):
     return utils.directory_checksum(utils.repo_root() / "circuit/templates", ".circom")
 
+
+def repo_circuit_checksum():
+    # Memoized on the stat fingerprint: TestingSetup.__init__ alone needs
+    # the checksum twice, and repeat calls cost a stat walk instead of
+    # re-hashing every template — while still picking up edits made while
+    # the script runs.
+    return _repo_circuit_checksum_for(_templates_fingerprint())
+
 def repo_circuit_setup_path():
     return TESTING_SETUPS_DIR / repo_circuit_checksum()
 
 def require_ptau_file():
     if PTAU_PATH.is_file():
         eprint("Powers-of-tau file found at " + str(PTAU_PATH) + ", skipping download.")
+        eprint("Checking sha256sum of ptau file...")
+        checksum = utils.file_checksum(PTAU_PATH)
     else:
         eprint("Downloading powers-of-tau file... (destination: " + str(PTAU_PATH) + ")")
-        utils.download_file(PTAU_URL, PTAU_PATH)
+        # The checksum is computed from the bytes in flight, so the 2+ GB
+        # file doesn't have to be read back for verification.
+        checksum = utils.download_file_with_sha256(PTAU_URL, PTAU_PATH)
         eprint("Finished downloading to " + str(PTAU_PATH) + ".")
 
-    eprint("Checking sha256sum of ptau file...")
-    if utils.file_checksum(PTAU_PATH) != PTAU_CHECKSUM:
+    if checksum != PTAU_CHECKSUM:
         eprint("WARNING: ptau file at " + str(PTAU_PATH) + " doesn't match expected sha256sum. Aborting.")
         exit(2)
 
@@ -52,7 +122,10 @@ class TestingSetup(setups.Setup):
 
     def compile_circuit(self):
         eprint("Compiling circuit...")
-        shutil.copytree(utils.repo_root() / "circuit/templates", "./", dirs_exist_ok=True)
+        # Hardlink the templates into the build dir instead of copying them;
+        # falls back to a real copy if the build dir is on another filesystem.
+        shutil.copytree(utils.repo_root() / "circuit/templates", "./",
+                        dirs_exist_ok=True, copy_function=utils.link_or_copy)
         utils.manage_deps.add_cargo_to_path()
         start_time = time.time()
         utils.run_shell_command('circom -l . -l $(. ~/.nvm/nvm.sh; npm root -g) main.circom --r1cs --wasm --c --sym')
@@ -68,13 +141,28 @@ class TestingSetup(setups.Setup):
         utils.run_shell_command(f'. ~/.nvm/nvm.sh; snarkjs zkey export verificationkey prover_key.zkey verification_key.json')
 
 
+    def start_c_witness_gen_build(self):
+        """
+        Launch `make` in main_c_cpp/ in the background and return the Popen
+        handle. The build only reads circom's C++ output, so callers can
+        overlap it with the (long) zkey setup.
+        """
+        eprint("Compiling c witness generation binaries now: "
+               + datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        self._witness_gen_build_start = time.time()
+        return subprocess.Popen("make -j$(nproc)", shell=True, cwd="main_c_cpp")
+
+
+    def wait_c_witness_gen_build(self, build):
+        if build.wait() != 0:
+            eprint("Error: compiling the c witness generation binaries failed.")
+            exit(1)
+        eprint("Witness gen compilation took %s seconds"
+               % (time.time() - self._witness_gen_build_start))
+
+
     def compile_c_witness_gen_binaries(self):
-        with contextlib.chdir("main_c_cpp"):
-            eprint("Compiling c witness generation binaries now: " 
-                   + datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-            start_time = time.time()
-            utils.run_shell_command("make")
-            eprint("Witness gen compilation took %s seconds" % (time.time() - start_time))
+        self.wait_c_witness_gen_build(self.start_c_witness_gen_build())
 
 
     def install_artifacts(self):
@@ -87,14 +175,27 @@ class TestingSetup(setups.Setup):
         if platform.machine() == 'x86_64':
             shutil.move("main_c_cpp/main_c", self.path())
             shutil.move("main_c_cpp/main_c.dat", self.path())
+        self.invalidate()
 
 
     def c_witness_gen_from_scratch(self):
         eprint("Setup doesn't contain c witness gen binaries, and you are on x86-64. Going to compile them now.")
-        self.compile_circuit()
-        self.compile_c_witness_gen_binaries()
-        shutil.move("main_c_cpp/main_c", self.path())
-        shutil.move("main_c_cpp/main_c.dat", self.path())
+        with _build_dir() as build_dir:
+            with contextlib.chdir(build_dir):
+                self.compile_circuit()
+                self.compile_c_witness_gen_binaries()
+                # os.replace overwrites, so a binary left behind by an
+                # interrupted earlier run can't fail the install. The build
+                # dir lives on the setups filesystem, so it's still a rename.
+                os.replace("main_c_cpp/main_c", self.path() / "main_c")
+                os.replace("main_c_cpp/main_c.dat", self.path() / "main_c.dat")
+        self.invalidate()
+
+
+    def download_from_cache(self):
+        found = cache.download_blob_if_present(self.checksum(), TESTING_SETUPS_DIR)
+        self.invalidate()
+        return found
 
 
     def procure(self, ignore_cache=False):
@@ -103,21 +204,30 @@ class TestingSetup(setups.Setup):
             if platform.machine() == 'x86_64' and not self.witness_gen_c():
                 self.c_witness_gen_from_scratch()
         else:
-            if not ignore_cache and cache.download_blob_if_present(self.checksum(), TESTING_SETUPS_DIR) and self.is_complete():
+            if not ignore_cache and self.download_from_cache() and self.is_complete():
                 if platform.machine() == 'x86_64' and not self.witness_gen_c():
                     self.c_witness_gen_from_scratch()
             else:
-                eprint("Deleting old testing setups...")
-                utils.delete_contents_of_dir(TESTING_SETUPS_DIR)
+                prune_stale_setups({self.checksum()})
                 require_ptau_file()
+                # This branch is only reached when the setup is incomplete,
+                # so clear out any leftovers (interrupted install, partial
+                # cache extraction) — shutil.move below refuses to overwrite.
+                shutil.rmtree(self.path(), ignore_errors=True)
                 self.mkdir()
-                self.compile_circuit()
-                self.run_setup()
-                if platform.machine() == 'x86_64':
-                    self.compile_c_witness_gen_binaries()
-                else:
-                     eprint("Not on x86_64, so skipping generating c witness gen binaries.")
-                self.install_artifacts()
+                with _build_dir() as build_dir:
+                    with contextlib.chdir(build_dir):
+                        self.compile_circuit()
+                        # The C++ witness gen build and the zkey setup both
+                        # only read circom's output, so run them in parallel.
+                        if platform.machine() == 'x86_64':
+                            witness_gen_build = self.start_c_witness_gen_build()
+                        else:
+                            eprint("Not on x86_64, so skipping generating c witness gen binaries.")
+                        self.run_setup()
+                        if platform.machine() == 'x86_64':
+                            self.wait_c_witness_gen_build(witness_gen_build)
+                        self.install_artifacts()
 
 
         
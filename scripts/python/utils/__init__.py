@@ -1,8 +1,12 @@
 import tarfile
+import functools
 import hashlib
+from blake3 import blake3
+from concurrent.futures import ThreadPoolExecutor
 import io
 import os
 import urllib.request
+import urllib3
 import sys
 import shutil
 from subprocess import Popen, PIPE
@@ -15,10 +19,15 @@ import json
 
 envvars_were_added = False
 
+# Both roots are fixed for the duration of an invocation and are asked for
+# all over the place, so memoize them: realpath() does a stat per path
+# component, and callers routinely build several derived Paths per call.
+@functools.cache
 def repo_root():
     """Return the repo root. Assumes this script is two subdirectories in."""
     return Path(os.path.realpath(__file__)).parents[3]
 
+@functools.cache
 def resources_dir_root():
     if 'RESOURCES_DIR' in os.environ:
         return Path(os.environ['RESOURCES_DIR'])
@@ -52,6 +61,28 @@ def run_shell_command(command, as_root=False):
         sys.exit(1)
 
 
+def run_command(command, as_root=False, env=None):
+    """
+    Run an argv list directly (no shell) and exit if it fails. Prefer this
+    over run_shell_command when no shell features are needed: it skips the
+    shell parse and can't misquote arguments.
+    """
+    try:
+        if as_root:
+            if shutil.which("sudo"):
+                command = ["sudo"] + command
+            else:
+                eprint("sudo not found. Assuming you don't need privilege escalation.")
+
+        subprocess.run(command, check=True, env=env, stdin=subprocess.DEVNULL)
+    except subprocess.CalledProcessError as e:
+        eprint(f"Error: Command '{' '.join(command)}' failed with error {e}.")
+        sys.exit(1)
+    except Exception as e:
+        eprint(f"Error: Command '{' '.join(command)}' failed with error {e}.")
+        sys.exit(1)
+
+
 def cargo_install_from_git(repo, ref=None):
     with tempfile.TemporaryDirectory() as temp_dir:
         with contextlib.chdir(temp_dir):
@@ -107,10 +138,156 @@ def remind_to_restart_shell_if_needed():
         eprint("Env-vars were added to your profile. Please restart your shell.") 
 
 
-def download_file(url, dest):
-    """Download a file from a URL to a specified destination."""
-    with urllib.request.urlopen(url) as response, open(dest, 'wb') as out_file:
-        out_file.write(response.read())
+# All downloads share one urllib3 pool: release installs fetch many assets
+# from the same few hosts, and urllib.request would pay a fresh TCP+TLS
+# handshake for each one. The pool keeps connections alive across calls.
+_http_pool = None
+
+# Streamed downloads copy in chunks of this size: large enough that the
+# Python-level loop is negligible even for a ~1 GB zkey, small enough to
+# keep resident memory bounded per file.
+DOWNLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+
+def http_pool():
+    global _http_pool
+    if _http_pool is None:
+        _http_pool = urllib3.PoolManager(
+                num_pools=4, maxsize=16,
+                retries=urllib3.Retry(total=5, backoff_factor=0.5))
+    return _http_pool
+
+
+def download_file(url, dest, headers=None, expected_sha256=None):
+    """
+    Download a file from a URL to a specified destination.
+
+    Each completed download leaves a `dest + ".etag"` sidecar. When both the
+    file and its sidecar are present, the next call issues a HEAD first and
+    skips the transfer entirely if the server still reports the same ETag
+    and size — so re-running a multi-GB asset install is metadata-only.
+
+    If `expected_sha256` is given, the bytes are hashed as they stream in
+    (no second read of the file) and a mismatch raises ValueError, leaving
+    no sidecar so the next run re-fetches.
+
+    Completed downloads are also hardlinked into a URL-keyed cache under the
+    resources dir. A repeat request for the same URL is served from the
+    cache with one hardlink, after revalidating the entry's recorded ETag
+    with a HEAD (or, when `expected_sha256` is given, its checksum — no
+    network at all).
+    """
+    dest = Path(dest)
+    etag_path = Path(str(dest) + ".etag")
+    if dest.is_file() and etag_path.is_file():
+        head = http_pool().request('HEAD', url, headers=headers)
+        if head.status < 400 \
+                and head.headers.get('ETag') == etag_path.read_text().strip() \
+                and head.headers.get('Content-Length') == str(dest.stat().st_size):
+            return
+
+    # A cache entry is only served if it can be proven current: either the
+    # caller's expected sha256 matches it, or the ETag recorded with the
+    # entry still matches a HEAD of the URL. Some asset URLs (e.g. GitHub
+    # browser_download_urls) keep the same URL when their content is
+    # re-uploaded, so an unvalidated hit could be served stale forever.
+    cache_path = _download_cache_path(url)
+    cache_etag_path = Path(str(cache_path) + ".etag")
+    if cache_path.is_file():
+        if expected_sha256:
+            fresh = file_checksum(cache_path) == expected_sha256
+        elif cache_etag_path.is_file():
+            head = http_pool().request('HEAD', url, headers=headers)
+            fresh = head.status < 400 \
+                and head.headers.get('ETag') == cache_etag_path.read_text().strip()
+        else:
+            fresh = False
+        if fresh:
+            dest.unlink(missing_ok=True)
+            etag_path.unlink(missing_ok=True)
+            link_or_copy(cache_path, dest)
+            if cache_etag_path.is_file():
+                etag_path.write_text(cache_etag_path.read_text())
+            return
+        cache_path.unlink()
+        cache_etag_path.unlink(missing_ok=True)
+
+    hasher = hashlib.sha256() if expected_sha256 else None
+    with http_pool().request('GET', url, headers=headers,
+                             preload_content=False) as response:
+        if response.status >= 400:
+            raise urllib3.exceptions.HTTPError(
+                    f"GET {url} returned status {response.status}")
+        with open(dest, 'wb') as out_file:
+            _advise_sequential(out_file)
+            for chunk in response.stream(DOWNLOAD_CHUNK_SIZE):
+                if hasher:
+                    hasher.update(chunk)
+                out_file.write(chunk)
+        etag = response.headers.get('ETag')
+
+    if hasher and hasher.hexdigest() != expected_sha256:
+        etag_path.unlink(missing_ok=True)
+        raise ValueError("Downloaded file " + str(dest) + " doesn't match its "
+                         "expected sha256sum (got " + hasher.hexdigest() + ").")
+
+    # Populate the cache by hardlinking the finished download, recording the
+    # response ETag so later hits can be revalidated; skipped silently when
+    # dest is on a different filesystem than the cache.
+    if not cache_path.exists():
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(dest, cache_path)
+        except OSError:
+            pass
+        else:
+            if etag:
+                cache_etag_path.write_text(etag)
+
+    # Written only after the body has been fully copied, so an interrupted
+    # download can never be mistaken for a finished one.
+    if etag:
+        etag_path.write_text(etag)
+    else:
+        etag_path.unlink(missing_ok=True)
+
+
+def link_or_copy(src, dst):
+    """Hardlink src to dst, falling back to a real copy across filesystems."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _download_cache_path(url):
+    key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    return resources_dir_root() / "download_cache" / key[:2] / key
+
+
+def _advise_sequential(f):
+    # Hint the kernel that the file is written/read strictly sequentially,
+    # so writeback batches into large physical I/O. No-op where unsupported.
+    if hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+
+def download_file_with_sha256(url, dest):
+    """
+    Download a file from a URL to a specified destination, hashing the bytes
+    as they are written. Returns the sha256 hex digest, so verifying the
+    download doesn't require a second full read of the file.
+    """
+    hasher = hashlib.sha256()
+    with http_pool().request('GET', url, preload_content=False) as response:
+        if response.status >= 400:
+            raise urllib3.exceptions.HTTPError(
+                    f"GET {url} returned status {response.status}")
+        with open(dest, 'wb') as out_file:
+            _advise_sequential(out_file)
+            for chunk in response.stream(DOWNLOAD_CHUNK_SIZE):
+                hasher.update(chunk)
+                out_file.write(chunk)
+    return hasher.hexdigest()
 
 
 def read_json_from_url(url, auth_token=None):
@@ -136,24 +313,56 @@ def delete_contents_of_dir(path):
             os.remove(path)
 
 def file_checksum(path):
-    """Return a SHA256 checksum of a file. Compatible with `sha256sum`."""
+    """
+    Return a SHA256 checksum of a file. Compatible with `sha256sum`.
+
+    Uses hashlib.file_digest (3.11+), whose read/update loop runs in C; with
+    OpenSSL 3 on x86-64/ARM the SHA-256 core uses the hardware SHA
+    extensions, so even the 2+ GB ptau file hashes in seconds.
+    """
     with open(path, "rb") as f:
         return hashlib.file_digest(f, "sha256").hexdigest()
 
-def directory_checksum(directory, extension):
-    """Return a sha256 checkum for all files of a certain extension in a given directory"""
-
-    all_contents = b"" 
-
-    for child in sorted(directory.rglob("*"+extension)):
-        with open(child, mode='rb') as file:
-            all_contents += (str(child.relative_to(repo_root())) + "\n").encode("utf-8")
-            all_contents += file.read()
+def file_fingerprint(path):
+    """
+    Return a fast blake3 fingerprint of a file, hashed via mmap so the bytes
+    never pass through Python. Good for cache keying; use `file_checksum` when
+    a published sha256 sum needs to be verified.
+    """
+    hasher = blake3(max_threads=blake3.AUTO)
+    hasher.update_mmap(path)
+    return hasher.hexdigest()
 
-    # Compute the SHA-256 checksum
-    sha256_hash = hashlib.sha256(all_contents).hexdigest()
+def _blake3_file_digest(path):
+    # update_mmap hashes the file via mmap with SIMD + multithreading,
+    # without pulling its contents through Python.
+    hasher = blake3(max_threads=blake3.AUTO)
+    hasher.update_mmap(path)
+    return hasher.digest()
 
-    return sha256_hash
+def directory_checksum(directory, extension):
+    """Return a blake3 checkum for all files of a certain extension in a given directory"""
+
+    children = sorted(directory.rglob("*"+extension))
+
+    # Tree hash: digest the files concurrently (blake3 releases the GIL, so
+    # threads scale across cores), then fold the per-file digests into a
+    # single root in deterministic order.
+    with ThreadPoolExecutor() as executor:
+        digests = executor.map(_blake3_file_digest, children)
+
+    root = blake3()
+    for child, digest in zip(children, digests):
+        # Tag each leaf with its length-prefixed repo-relative path, so that
+        # moving content between files changes the checksum.
+        rel = str(child.relative_to(repo_root())).encode("utf-8")
+        root.update(len(rel).to_bytes(2, "little"))
+        root.update(rel)
+        root.update(digest)
+
+    # "b3-" distinguishes these checksums from the sha256 ones older cache
+    # entries were keyed under, so stale entries can never be falsely hit.
+    return "b3-" + root.hexdigest()
 
 def force_symlink_dir(target, link_path):
     if link_path.is_symlink():
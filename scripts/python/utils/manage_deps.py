@@ -1,3 +1,4 @@
+import functools
 import subprocess
 import sys
 from utils import eprint
@@ -62,6 +63,10 @@ def add_cargo_to_path():
 def install_npm_package(package):
     utils.run_shell_command(". ~/.nvm/nvm.sh; npm install -g " + package)
 
+# Cached: the answer can't change mid-run, and installing a list of deps
+# would otherwise repeat the platform check plus PATH walks several times
+# per dependency.
+@functools.cache
 def platform_package_manager():
     if platform.system() == 'Linux':
         if shutil.which("apt-get"):
@@ -84,46 +89,46 @@ def platform_package_manager():
     return "brew"
 
 
-def run_platform_package_manager_command(package):
+def run_platform_package_manager_command(packages):
+    """Install the given list of packages with the platform's package manager."""
     package_manager = platform_package_manager()
     try:
         if package_manager == "brew":
-            utils.run_shell_command("brew install " + package)
+            utils.run_command(["brew", "install"] + packages)
         elif package_manager == "pacman":
-            utils.run_shell_command("pacman -S --needed --noconfirm " + package, as_root=True)
+            utils.run_command(["pacman", "-S", "--needed", "--noconfirm"] + packages,
+                              as_root=True)
         elif package_manager == "apt-get":
-            utils.run_shell_command("apt-get update", as_root=True)
-            utils.run_shell_command("apt-get install -y " + package, as_root=True)
+            # Non-interactive, so a config-file prompt can't hang CI waiting
+            # on stdin we've closed.
+            env = {**os.environ, "DEBIAN_FRONTEND": "noninteractive"}
+            utils.run_command(["apt-get", "update"], as_root=True, env=env)
+            utils.run_command(["apt-get", "install", "-y"] + packages,
+                              as_root=True, env=env)
     except Exception as e:
-        eprint("Installing " + package + " failed. Exception: ")
+        eprint("Installing " + " ".join(packages) + " failed. Exception: ")
         eprint(e)
         eprint("Exiting.")
         exit(2)
 
 
-def install_using_package_manager(name, package):
-    eprint("Installing " + name)
-
+def platform_package_name(name, package):
+    """
+    Resolve a dep's package name for the current platform's package manager.
+    Returns None when the current platform doesn't need to install it.
+    """
     # package is either ...
     if type(package) is str:
         # ... a string, which means the package name is consistent across
         # all supported platforms, or ...
-        run_platform_package_manager_command(package)
-    elif type(package) is dict:
-        # ... a dict, which specifies a platform-specific package name.
-        if platform_package_manager() not in package:
-            eprint("Don't know a way to install package " + package + " on the current distribution.")
-            exit(2)
-        platform_specific_package = package[platform_package_manager()]
-        if platform_specific_package is None:
-            # Sometimes a specific platform doesn't need to install the package, 
-            # e.g. if it is already installed by default on this platform. We 
-            # represent this by specifying None for this platform.
-            eprint("The current system doesn't need to install " + name + ".")
-        else:
-            run_platform_package_manager_command(platform_specific_package)
-
-    eprint("Done installing " + name)
+        return package
+    # ... a dict, which specifies a platform-specific package name.
+    if platform_package_manager() not in package:
+        eprint("Don't know a way to install package " + name + " on the current distribution.")
+        exit(2)
+    # A None entry means this platform doesn't need to install the package,
+    # e.g. because it ships with the system.
+    return package[platform_package_manager()]
 
 
 # This dict defines the installation behavior for each dependency.
@@ -176,23 +181,63 @@ deps_by_platform = {
         }
 
 
+@functools.cache
+def resolved_deps():
+    """
+    deps_by_platform with the platform-specific dicts already reduced to this
+    platform's package name (or None), so installing becomes a plain dict
+    lookup with no per-dep platform dispatch. Resolved lazily rather than at
+    import, because resolution exits on unsupported platforms.
+    """
+    return { dep: handler if callable(handler) else platform_package_name(dep, handler)
+             for dep, handler in deps_by_platform.items() }
+
+
 def install_dep(dep):
     if dep not in deps_by_platform:
         eprint("Dependency " + dep + " not recognized.")
         exit(2)
-    handler = deps_by_platform[dep]
+    handler = resolved_deps()[dep]
 
-    # deps_by_platform[dep] is either ...
+    # The resolved handler is either ...
     if callable(handler):
-        # ... a function, which means calling it should install the dep ...
+        # ... a function, which means calling it should install the dep, ...
         handler()
+    elif handler is None:
+        # ... None, meaning this platform doesn't need to install it, ...
+        eprint("The current system doesn't need to install " + dep + ".")
     else:
-        # ... or is a string or dict specifying a name that the system package
-        # manager should use to install the package. In that case, use the system
-        # package manager.
-        install_using_package_manager(dep, handler)
+        # ... or the package name the system package manager should install.
+        eprint("Installing " + dep)
+        run_platform_package_manager_command([handler])
+        eprint("Done installing " + dep)
 
 
 def install_deps(deps):
+    """
+    Install the given dependencies. All package-manager deps are batched into
+    a single install command, so the package manager's startup cost (package
+    index load, dpkg lock, the `apt-get update`) is paid once rather than
+    once per package. Function-installed deps then run in their given order,
+    which matters: e.g. the npm installs need node in place first.
+    """
+    handlers = []
+    packages = []
     for dep in deps:
-        install_dep(dep)
+        if dep not in deps_by_platform:
+            eprint("Dependency " + dep + " not recognized.")
+            exit(2)
+        handler = resolved_deps()[dep]
+        if callable(handler):
+            handlers.append(handler)
+        elif handler is None:
+            eprint("The current system doesn't need to install " + dep + ".")
+        else:
+            packages.append(handler)
+
+    if packages:
+        eprint("Installing " + ", ".join(packages) + " using the system package manager.")
+        run_platform_package_manager_command(packages)
+
+    for handler in handlers:
+        handler()
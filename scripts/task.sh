@@ -90,9 +90,15 @@ install_deps
 if ! ls .venv &> /dev/null; then
   python3 -m venv .venv
 fi
-if ! .venv/bin/pip3 show google-cloud-storage typer typing_extensions &> /dev/null;  then
-  .venv/bin/pip3 install google-cloud-storage typer typing_extensions &> /dev/null
-fi
+# Note: `pip3 show pkg1 pkg2 ...` exits 0 if *any* of the packages is
+# installed, so the packages have to be checked one at a time.
+PYTHON_DEPS="google-cloud-storage typer typing_extensions ijson numpy blake3 zstandard orjson urllib3"
+for pkg in $PYTHON_DEPS; do
+  if ! .venv/bin/pip3 show "$pkg" &> /dev/null; then
+    .venv/bin/pip3 install $PYTHON_DEPS &> /dev/null
+    break
+  fi
+done
 
 .venv/bin/python3 $SCRIPT_DIR/python/main.py "$@"
 